@@ -1,7 +1,7 @@
 import vconv
+import numpy as np
 from enum import Enum
 from collections import Counter
-from fractions import Fraction
 from collections import namedtuple
 import itertools
 
@@ -173,7 +173,7 @@ def input_gen(t):
             print('lw: {}, rw: {}, lp: {}, rp: {}, ist: {}'.format(lw, rw, lp,
                 rp, ist))
             for spec in itertools.product(t.start, t.l1, t.l2, t.l3, t.gs): 
-                yield vc, grid_range(*spec, vc.stride_ratio.denominator)
+                yield vc, grid_range(*spec, vc.sr_den)
 
 
 def main_test(inputs):
@@ -182,7 +182,7 @@ def main_test(inputs):
     results = Counter() 
     print('Test: {}'.format(t.name))
     for vc, x in input_gen(t): 
-        if vc.stride_ratio.numerator > 1: 
+        if vc.sr_num > 1: 
             res = downsample_test(vc, x)
         else:
             res = same_or_upsample_test(vc, x)
@@ -303,6 +303,127 @@ winsize = 10000
 print('Usage test for window size {}'.format(winsize))
 usage_test((upsample[0], decoder[1]), winsize)
 
+def batched_test(vc_range, n_sub_win, winsize):
+    sub_b = np.arange(n_sub_win)
+    full, sub, gs = vconv.input_range_multi(*vc_range, (0, 90000), sub_b,
+            sub_b + winsize, 1)
+    results = Counter()
+    for b in range(n_sub_win):
+        out = vconv.GridRange((0, 90000), (b, b + winsize), 1)
+        input = vconv.input_range(*vc_range, out)
+        batched = vconv.GridRange((full[0][b], full[1][b]),
+                (sub[0][b], sub[1][b]), gs)
+        if repr(batched) == repr(input):
+            results[Result.SUCCESS] += 1
+        else:
+            results[Result.UNEQUAL] += 1
+    print(results)
+
+for use_numba in (True, False):
+    vconv.use_numba = use_numba
+    print('Batched input_range test for upsample + decoder, use_numba={}'.format(
+        use_numba))
+    batched_test((upsample[0], decoder[1]), 2000, 100)
+    print()
+vconv.use_numba = True
+
+def output_batched_test(vc_range, n_sub_win, winsize):
+    outs = [vconv.GridRange((0, 90000), (b, b + winsize), 1)
+            for b in range(n_sub_win)]
+    outs.append(vconv.GridRange((0, 90000), (0, 90000), 1))
+    inputs = [vconv.input_range(*vc_range, out) for out in outs]
+    bounds = [np.array([getattr(i, f)[k] for i in inputs])
+            for f in ('full', 'sub') for k in (0, 1)]
+    full, sub, gs = vconv.output_range_batched(vconv.compile_chain(*vc_range),
+            *bounds, inputs[0].gs)
+    results = Counter()
+    for n, input in enumerate(inputs):
+        output = vconv.output_range(*vc_range, input)
+        batched = vconv.GridRange((full[0][n], full[1][n]),
+                (sub[0][n], sub[1][n]), gs)
+        if repr(batched) == repr(output):
+            results[Result.SUCCESS] += 1
+        else:
+            results[Result.UNEQUAL] += 1
+    print(results)
+
+print('Batched output_range test for encoder_clip + upsample')
+output_batched_test((encoder_clip[0], upsample[1]), 2000, 2146)
+print()
+
+def bigint_test(vc_range, n_sub_win, winsize):
+    # Coordinates past the int64 range, so the batched functions must fall
+    # back to Python ints
+    base = 2 ** 70
+    full_out = (base, base + 90000)
+    sub_b = np.array([base + b for b in range(n_sub_win)], dtype=object)
+    in_full, in_sub, in_gs = vconv.input_range_multi(*vc_range, full_out,
+            sub_b, sub_b + winsize, 1)
+    out_full, out_sub, out_gs = vconv.output_range_batched(
+            vconv.compile_chain(*vc_range), *in_full, *in_sub, in_gs)
+    results = Counter()
+    for n in range(n_sub_win):
+        out = vconv.GridRange(full_out, (base + n, base + n + winsize), 1)
+        input = vconv.input_range(*vc_range, out)
+        output = vconv.output_range(*vc_range, input)
+        batched_in = vconv.GridRange((in_full[0][n], in_full[1][n]),
+                (in_sub[0][n], in_sub[1][n]), in_gs)
+        batched_out = vconv.GridRange((out_full[0][n], out_full[1][n]),
+                (out_sub[0][n], out_sub[1][n]), out_gs)
+        if (repr(batched_in) == repr(input) and
+                repr(batched_out) == repr(output)):
+            results[Result.SUCCESS] += 1
+        else:
+            results[Result.UNEQUAL] += 1
+    print(results)
+
+print('Batched range test with coordinates beyond int64')
+bigint_test((upsample[0], decoder[1]), 200, 100)
+print()
+
+def relink_test():
+    # Relinking a chain must invalidate memoized range results
+    def make(mid_filter):
+        head = vconv.VirtualConv(3, name='head')
+        mid = vconv.VirtualConv(mid_filter, parent=head, name='mid')
+        tail = vconv.VirtualConv(3, parent=mid, name='tail')
+        return head, mid, tail
+
+    out = vconv.GridRange((0, 1000), (100, 200), 1)
+    head, mid, tail = make(5)
+    before = vconv.input_range(head, tail, out)
+    new_mid = vconv.VirtualConv(9, name='mid')
+    vconv.set_parent(new_mid, head)
+    vconv.set_parent(tail, new_mid)
+    after = vconv.input_range(head, tail, out)
+    expected = vconv.input_range(*make(9)[::2], out)
+    if repr(after) == repr(expected) and repr(after) != repr(before):
+        print(Result.SUCCESS)
+    else:
+        print(Result.UNEQUAL)
+
+print('Relink test')
+relink_test()
+print()
+
+def second_child_test():
+    # input_range follows parent links, so adding another child to a node
+    # must not change ranges computed through its first child
+    x = vconv.VirtualConv(3, name='x')
+    y = vconv.VirtualConv(5, parent=x, name='y')
+    out = vconv.GridRange((0, 1000), (100, 200), 1)
+    before = vconv.input_range(x, y, out)
+    vconv.VirtualConv(3, parent=x, name='z')
+    after = vconv.input_range(x, y, out)
+    if repr(after) == repr(before):
+        print(Result.SUCCESS)
+    else:
+        print(Result.UNEQUAL)
+
+print('Second child test')
+second_child_test()
+print()
+
 # for s in range(56730, 57073, 30):
 #     autoenc_test(vcs, 100000, s)
 
@@ -1,10 +1,27 @@
 import math
+import logging
+import functools
 import numpy as np
+from collections import namedtuple
 
 """
 See doc/vconv_notes.txt 
 """
 
+logger = logging.getLogger(__name__)
+
+# (source, dest[, backward]) => result of _chain, _spacing_ratios and
+# compile_chain, respectively
+_chain_cache = {}
+_spacing_cache = {}
+_compiled_cache = {}
+
+# Set to False to always use the NumPy implementation of input_range_batched
+use_numba = True
+# The vconv_jit module; None until first looked up, False if numba is not
+# installed
+_jit = None
+
 class GridRange(object):
     """
     Defines virtual tensor and subrange, embedded in a global coordinate grid.
@@ -51,6 +68,10 @@ class VirtualConv(object):
 
     Then, use the final child to calculate needed input size for a desired
     output size, and offsets relative to the input.
+
+    Range results are memoized per chain, so don't reassign 'parent' or
+    'child' directly.  Use set_parent, or call vconv.clear_caches() after
+    relinking.
     '''
     def __init__(self, filter_info, padding=(0, 0), stride=1,
             is_downsample=True, name=None, parent=None):
@@ -64,6 +85,7 @@ class VirtualConv(object):
 
         if self.parent is not None:
             self.parent.child = self
+            clear_caches()
 
         if isinstance(filter_info, tuple):
             self.l_wing_sz = filter_info[0]
@@ -76,144 +98,162 @@ class VirtualConv(object):
             raise RuntimeError('filter_info must be either a 2-tuple of '
                     '(l_wing_sz, r_wing_sz) or an integer of filter_sz')
 
+        self._derive()
+
         # Ensures that the key filter element is always over a non-padding
         # region.
         if (self.l_pad > self.l_wing_sz or self.r_pad > self.r_wing_sz):
-            # print(self)
             raise RuntimeError('Filter wing sizes cannot be less than the respective '
-                    'padding')
-        # print(self)
-        
+                    'padding: {!r}'.format(self))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%r', self)
 
     def __repr__(self):
         fmt = '[{}^{}, {}/{}, {}--{}, "{}"]'
+        return fmt.format(self.l_wing_sz, self.r_wing_sz, self.sr_num,
+                self.sr_den, self.l_pad, self.r_pad, self.name)
+
+    def __getstate__(self):
+        # Keep VirtualConv picklable: the bound range functions are closures,
+        # which can't be pickled, so drop them and rebuild in __setstate__
+        state = self.__dict__.copy()
+        del state['_input_range']
+        del state['_output_range']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._derive()
+
+    def _derive(self):
+        """
+        Compute fields derived from the (immutable) wing, padding and stride
+        values, including _input_range and _output_range specialized for them
+        """
+        # stride ratio as an integer (numerator, denominator) pair
         if self.is_downsample:
-            n, d = self.stride, 1
+            self.sr_num, self.sr_den = self.stride, 1
         else:
-            n, d = 1, self.stride
+            self.sr_num, self.sr_den = 1, self.stride
+
+        # Net change in range bounds from padding then filtering
+        self.lw_minus_lp = self.l_wing_sz - self.l_pad
+        self.rw_minus_rp = self.r_wing_sz - self.r_pad
 
-        return fmt.format(self.l_wing_sz, self.r_wing_sz, n, d, self.l_pad,
-                self.r_pad, self.name)
+        self._input_range = self._make_input_range()
+        self._output_range = self._make_output_range()
 
-    # @profile
-    def _output_range(self, full_in, sub_in, gs_in):
-        full_in_b, full_in_e = full_in
-        sub_in_b, sub_in_e = sub_in
+    def _make_output_range(self):
+        """
+        Returns a function (full_in, sub_in, gs_in) => (full_out, sub_out,
+        gs_out), or None if the output is empty.
+        """
         if self.is_downsample:
-            gs_out = gs_in * self.stride
-            lpg = self.l_pad * gs_in
-            rpg = self.r_pad * gs_in
-            lwg = self.l_wing_sz * gs_in
-            rwg = self.r_wing_sz * gs_in
-            full_in_adj_b = full_in_b - lpg 
-            full_in_adj_e = full_in_e + rpg
-            if full_in_adj_e - full_in_adj_b < lwg + rwg:
-                return None
-            if sub_in_e - sub_in_b < lwg + rwg:
-                return None
-            full_out_b = full_in_adj_b + lwg
-            full_out_pre_e = full_in_adj_e - rwg
-            full_out_e = full_out_pre_e - (full_out_pre_e - full_out_b) % gs_out
-            sub_out_pre_b = sub_in_b + lwg
-            sub_out_pre_e = sub_in_e - rwg
-            # Due to stride filtering, this adjustment may produce
-            # an empty or reverse range
-            sub_out_b = sub_out_pre_b + (full_out_e - sub_out_pre_b) % gs_out
-            sub_out_e = sub_out_pre_e - (sub_out_pre_e - full_out_b) % gs_out
-            if sub_out_e - sub_out_b <= 0:
-                return None
+            # @profile
+            def _output_range(full_in, sub_in, gs_in, st=self.stride,
+                    lw=self.l_wing_sz, rw=self.r_wing_sz,
+                    lm=self.lw_minus_lp, rm=self.rw_minus_rp):
+                full_in_b, full_in_e = full_in
+                sub_in_b, sub_in_e = sub_in
+                gs_out = gs_in * st
+                full_out_b = full_in_b + lm * gs_in
+                full_out_pre_e = full_in_e - rm * gs_in
+                if full_out_pre_e < full_out_b:
+                    return None
+                sub_out_pre_b = sub_in_b + lw * gs_in
+                sub_out_pre_e = sub_in_e - rw * gs_in
+                if sub_out_pre_e < sub_out_pre_b:
+                    return None
+                full_out_e = (full_out_pre_e - (full_out_pre_e - full_out_b)
+                        % gs_out)
+                # Due to stride filtering, this adjustment may produce
+                # an empty or reverse range
+                sub_out_b = sub_out_pre_b + (full_out_e - sub_out_pre_b) % gs_out
+                sub_out_e = sub_out_pre_e - (sub_out_pre_e - full_out_b) % gs_out
+                if sub_out_e - sub_out_b <= 0:
+                    return None
+                return (full_out_b, full_out_e), (sub_out_b, sub_out_e), gs_out
 
         else:
-            inv_st = self.stride
-            assert gs_in % self.stride == 0
-            gs_out = gs_in // self.stride
-            lpg = self.l_pad * gs_out
-            rpg = self.r_pad * gs_out
-            lwg = self.l_wing_sz * gs_out
-            rwg = self.r_wing_sz * gs_out
-            full_in_adj_b = full_in_b - lpg
-            full_in_adj_e = full_in_e + rpg
-            if sub_in_b == full_in_b:
-                sub_in_adj_b = full_in_adj_b
-            else:
-                sub_in_adj_b = sub_in_b - (inv_st - 1) * gs_out
-            if sub_in_e == full_in_e:
-                sub_in_adj_e = full_in_adj_e
-            else:
-                sub_in_adj_e = sub_in_e + (inv_st - 1) * gs_out
-            if full_in_adj_e - full_in_adj_b < lwg + rwg:
-                return None
-            if sub_in_adj_e - sub_in_adj_b < lwg + rwg:
-                return None
-            full_out_b = full_in_adj_b + lwg
-            full_out_e = full_in_adj_e - rwg
-            sub_out_b = sub_in_adj_b + lwg
-            sub_out_e = sub_in_adj_e - rwg
-
-        return (full_out_b, full_out_e), (sub_out_b, sub_out_e), gs_out
-
-    # @profile
-    def _input_range(self, full_out, sub_out, gs_out):
+            # Offsets from an interior sub input bound to the output bound,
+            # which first extends the bound to cover the inserted elements
+            l_sub = self.l_wing_sz - (self.stride - 1)
+            r_sub = self.stride - 1 - self.r_wing_sz
+
+            # @profile
+            def _output_range(full_in, sub_in, gs_in, inv_st=self.stride,
+                    l_sub=l_sub, r_sub=r_sub,
+                    lm=self.lw_minus_lp, rm=self.rw_minus_rp):
+                full_in_b, full_in_e = full_in
+                sub_in_b, sub_in_e = sub_in
+                assert gs_in % inv_st == 0
+                gs_out = gs_in // inv_st
+                full_out_b = full_in_b + lm * gs_out
+                full_out_e = full_in_e - rm * gs_out
+                if full_out_e < full_out_b:
+                    return None
+                sub_out_b = (full_out_b if sub_in_b == full_in_b
+                        else sub_in_b + l_sub * gs_out)
+                sub_out_e = (full_out_e if sub_in_e == full_in_e
+                        else sub_in_e + r_sub * gs_out)
+                if sub_out_e < sub_out_b:
+                    return None
+                return (full_out_b, full_out_e), (sub_out_b, sub_out_e), gs_out
+
+        return _output_range
+
+    def _make_input_range(self):
         """
-        Return the full and sub input range in physical coordinates.
-        Assume the output ranges full_out and sub_out are in a grid spacing
-        of gs_out.
+        Returns a function (full_out, sub_out, gs_out) => (full_in, sub_in,
+        gs_in) giving the full and sub input range in physical coordinates,
+        or None if the input is empty.  Assumes the output ranges full_out
+        and sub_out are in a grid spacing of gs_out.
         """
-        full_out_b, full_out_e = full_out
-        sub_out_b, sub_out_e = sub_out
-
         if self.is_downsample:
-            assert gs_out % self.stride == 0
-            gs_in = gs_out // self.stride
-            lwg = self.l_wing_sz * gs_in
-            rwg = self.r_wing_sz * gs_in
-            lpg = self.l_pad * gs_in
-            rpg = self.r_pad * gs_in
-
-            full_in_pre_b = full_out_b - lwg
-            full_in_pre_e = full_out_e + rwg
-            sub_in_pre_b = sub_out_b - lwg
-            sub_in_pre_e = sub_out_e + rwg
-
-            if full_in_pre_e - full_in_pre_b < lwg + rwg:
-                return None
-            if sub_in_pre_e - sub_in_pre_b < lwg + rwg:
-                return None
-
-            full_in_b = full_in_pre_b + lpg
-            full_in_e = full_in_pre_e - rpg
-            sub_in_b = max(sub_in_pre_b, full_in_b)
-            sub_in_e = min(sub_in_pre_e, full_in_e)
+            # @profile
+            def _input_range(full_out, sub_out, gs_out, st=self.stride,
+                    lw=self.l_wing_sz, rw=self.r_wing_sz,
+                    lm=self.lw_minus_lp, rm=self.rw_minus_rp):
+                full_out_b, full_out_e = full_out
+                sub_out_b, sub_out_e = sub_out
+                assert gs_out % st == 0
+                gs_in = gs_out // st
+                if full_out_e < full_out_b or sub_out_e < sub_out_b:
+                    return None
+                full_in_b = full_out_b - lm * gs_in
+                full_in_e = full_out_e + rm * gs_in
+                sub_in_b = max(sub_out_b - lw * gs_in, full_in_b)
+                sub_in_e = min(sub_out_e + rw * gs_in, full_in_e)
+                return (full_in_b, full_in_e), (sub_in_b, sub_in_e), gs_in
 
         else:
-            gs_in = gs_out * self.stride
-            lwg = self.l_wing_sz * gs_out
-            rwg = self.r_wing_sz * gs_out
-            lpg = self.l_pad * gs_out
-            rpg = self.r_pad * gs_out
-
-            full_in_adj_b = full_out_b - lwg
-            full_in_adj_e = full_out_e + rwg
-            sub_in_adj_b = sub_out_b - lwg
-            sub_in_adj_e = sub_out_e + rwg
-
-            full_in_b = full_in_adj_b + lpg
-            full_in_pre_e = full_in_adj_e - rpg
-            e_mod_adjust = - (full_in_pre_e - full_in_b) % gs_in
-            full_in_e = full_in_pre_e + e_mod_adjust
-
-            # Due to input spacing, this range may be empty or reversed
-            assert sub_in_adj_b <= full_in_e
-            assert full_in_b <= sub_in_adj_e
-            assert (full_in_e - full_in_b) % gs_in == 0
-            sub_in_b = sub_in_adj_b + (full_in_e - sub_in_adj_b) % gs_in
-            sub_in_e = sub_in_adj_e - (sub_in_adj_e - full_in_b) % gs_in
-            if sub_in_e - sub_in_b <= 0:
-                return None
-
-        #print('{} {} {}'.format((full_in_b, full_in_e), (sub_in_b, sub_in_e),
-        #    gs_in))
-        return (full_in_b, full_in_e), (sub_in_b, sub_in_e), gs_in
+            # @profile
+            def _input_range(full_out, sub_out, gs_out, inv_st=self.stride,
+                    lw=self.l_wing_sz, rw=self.r_wing_sz,
+                    lm=self.lw_minus_lp, rm=self.rw_minus_rp):
+                full_out_b, full_out_e = full_out
+                sub_out_b, sub_out_e = sub_out
+                gs_in = gs_out * inv_st
+                sub_in_adj_b = sub_out_b - lw * gs_out
+                sub_in_adj_e = sub_out_e + rw * gs_out
+
+                full_in_b = full_out_b - lm * gs_out
+                full_in_pre_e = full_out_e + rm * gs_out
+                # round the end up so that full_in_e - full_in_b is a
+                # multiple of gs_in
+                e_mod_adjust = - (full_in_pre_e - full_in_b) % gs_in
+                full_in_e = full_in_pre_e + e_mod_adjust
+
+                # Due to input spacing, this range may be empty or reversed
+                assert sub_in_adj_b <= full_in_e
+                assert full_in_b <= sub_in_adj_e
+                sub_in_b = sub_in_adj_b + (full_in_e - sub_in_adj_b) % gs_in
+                sub_in_e = sub_in_adj_e - (sub_in_adj_e - full_in_b) % gs_in
+                if sub_in_e - sub_in_b <= 0:
+                    return None
+                return (full_in_b, full_in_e), (sub_in_b, sub_in_e), gs_in
+
+        return _input_range
 
     def _output_offsets(self):
         """
@@ -236,30 +276,36 @@ def input_range(source, dest, out):
     to the given full and sub output ranges.  Assume consecutive tensor
     elements are physically grid_spacing units apart.
     """
-    vc = dest
-    full = out.full[0], out.full[1] - 1
-    sub = out.sub[0], out.sub[1] - 1
-    gs = out.gs
+    # Python ints, so results don't depend on the numeric types of whichever
+    # query filled the cache
+    full, sub, gs = _cached_input_range(source, dest,
+            tuple(int(v) for v in out.full), tuple(int(v) for v in out.sub),
+            int(out.gs))
+    return GridRange(full, sub, gs)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_input_range(source, dest, full, sub, gs):
+    full = full[0], full[1] - 1
+    sub = sub[0], sub[1] - 1
 
     # full = full_out[0], full_out[1] - 1
     # sub = sub_out[0], sub_out[1] - 1
     # gs = grid_spacing
     #results = [((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs)]
+    debug = logger.isEnabledFor(logging.DEBUG)
 
-    while True:
+    for vc in reversed(_chain(source, dest, backward=True)):
         res = vc._input_range(full, sub, gs)
         if res is None:
             raise RuntimeError('empty input range')
         else:
             full, sub, gs = res
         #results.append(((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs))
-        #fmt = 'input_range: full: {}, sub: {}, gs: {}, ind: {}, vc: {}'
-        #print(fmt.format(full, sub, gs, to_index(full, sub, gs), vc))
-        if vc is source:
-            break
-        vc = vc.parent
-    # return (full[0], full[1] + 1), (sub[0], sub[1] + 1), gs 
-    return GridRange((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs)
+        if debug:
+            logger.debug('input_range: full: %s, sub: %s, gs: %s, vc: %r',
+                    full, sub, gs, vc)
+    return (full[0], full[1] + 1), (sub[0], sub[1] + 1), gs
     #return results
 
 
@@ -272,16 +318,23 @@ def output_range(source, dest, gin):
 
     Raises exception if either is an empty range
     """
-    vc = source
-    full = gin.full[0], gin.full[1] - 1
-    sub = gin.sub[0], gin.sub[1] - 1
-    gs = gin.gs
+    full, sub, gs = _cached_output_range(source, dest,
+            tuple(int(v) for v in gin.full), tuple(int(v) for v in gin.sub),
+            int(gin.gs))
+    return GridRange(full, sub, gs)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_output_range(source, dest, full, sub, gs):
+    full = full[0], full[1] - 1
+    sub = sub[0], sub[1] - 1
     # full = full_in[0], full_in[1] - 1
     # sub = sub_in[0], sub_in[1] - 1
     # gs = grid_spacing
     #results = [((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs)]
+    debug = logger.isEnabledFor(logging.DEBUG)
 
-    while True:
+    for vc in _chain(source, dest):
         res = vc._output_range(full, sub, gs)
         if res is None:
             raise RuntimeError('empty output range')
@@ -289,26 +342,65 @@ def output_range(source, dest, gin):
             full, sub, gs = res
 
         #results.append(((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs))
-        #fmt = 'output_range: full: {}, sub: {}, gs: {}, ind: {}, vc: {}'
-        #print(fmt.format(full, sub, gs, to_index(full, sub, gs), vc))
-        if vc is dest:
-            break
-        vc = vc.child
-    # return (full[0], full[1] + 1), (sub[0], sub[1] + 1), gs 
-    return GridRange((full[0], full[1] + 1), (sub[0], sub[1] + 1), gs)
+        if debug:
+            logger.debug('output_range: full: %s, sub: %s, gs: %s, vc: %r',
+                    full, sub, gs, vc)
+    return (full[0], full[1] + 1), (sub[0], sub[1] + 1), gs
     #return results
 
 
+def _chain(source, dest, backward=False):
+    """
+    Return the tuple of VirtualConvs from source to dest inclusive.  It is
+    found by following child links from source, or if backward, parent links
+    from dest.  Cached per (source, dest, backward).
+    """
+    key = (source, dest, backward)
+    vcs = _chain_cache.get(key)
+    if vcs is None:
+        vcs = []
+        vc, end = (dest, source) if backward else (source, dest)
+        while True:
+            if vc is None:
+                raise RuntimeError('{!r} is not reachable from {!r}'.format(
+                    dest, source))
+            vcs.append(vc)
+            if vc is end:
+                break
+            vc = vc.parent if backward else vc.child
+        if backward:
+            vcs.reverse()
+        vcs = _chain_cache[key] = tuple(vcs)
+    return vcs
+
+
+def set_parent(vc, parent):
+    """
+    Link vc to follow parent in a chain, discarding memoized results
+    """
+    vc.parent = parent
+    parent.child = vc
+    clear_caches()
+
+
+def clear_caches():
+    """
+    Discard memoized range results.  Must be called whenever the parent/child
+    links of an existing chain are changed.
+    """
+    _cached_input_range.cache_clear()
+    _cached_output_range.cache_clear()
+    _spacing_cache.clear()
+    _chain_cache.clear()
+    _compiled_cache.clear()
+
+
 def output_offsets(source, dest):
-    vc = source
     lo, ro = 0, 0
-    while True:
+    for vc in _chain(source, dest):
         offsets = vc._output_offsets()
         lo += offsets[0]
         ro += offsets[1]
-        if vc is dest:
-            break
-        vc = vc.child
     return lo, ro
 
 
@@ -327,22 +419,256 @@ def tensor_slice(ref_gcoord, subrange_gcoord):
     return bp // rgs, (ep - 1) // rgs + 1
 
 
+def _spacing_ratios(source, dest):
+    """
+    Return (max_num, max_den, den_lcm) for the chain source => dest, where
+    max_num / max_den is the largest cumulative stride ratio reached (at least
+    1), and den_lcm is the lcm of the denominators of all cumulative ratios.
+    Cached per (source, dest) pair.
+    """
+    key = (source, dest)
+    res = _spacing_cache.get(key)
+    if res is not None:
+        return res
+    num, den = 1, 1
+    max_num, max_den, den_lcm = 1, 1, 1
+    for vc in _chain(source, dest):
+        num *= vc.sr_num
+        den *= vc.sr_den
+        g = math.gcd(num, den)
+        num //= g
+        den //= g
+        den_lcm = math.lcm(den_lcm, den)
+        if num * max_den > max_num * den:
+            max_num, max_den = num, den
+    res = _spacing_cache[key] = max_num, max_den, den_lcm
+    return res
+
+
 def max_spacing(source, dest, initial_gs):
     """
     Calculate the maximum grid spacing achieved between source a destination
     """
-    gs = initial_gs
-    max_gs = gs 
-    vc = source
-    while True:
-        if vc.is_downsample:
-            gs *= vc.stride
+    max_num, max_den, den_lcm = _spacing_ratios(source, dest)
+    # every intermediate grid spacing must be a whole number
+    assert initial_gs % den_lcm == 0
+    return initial_gs * max_num // max_den
+
+
+Chain = namedtuple('Chain', ['lw', 'rw', 'lp', 'rp', 'stride', 'is_downsample'])
+
+
+def compile_chain(source, dest):
+    """
+    Flatten the chain of VirtualConvs source => dest into parallel arrays,
+    ordered from source to dest, for use with the batched range functions.
+    """
+    vcs = _chain(source, dest)
+    return Chain(
+            lw=np.array([v.l_wing_sz for v in vcs], dtype=np.int64),
+            rw=np.array([v.r_wing_sz for v in vcs], dtype=np.int64),
+            lp=np.array([v.l_pad for v in vcs], dtype=np.int64),
+            rp=np.array([v.r_pad for v in vcs], dtype=np.int64),
+            stride=np.array([v.stride for v in vcs], dtype=np.int64),
+            is_downsample=np.array([v.is_downsample for v in vcs], dtype=bool)
+            )
+
+
+def _layers(chain):
+    return zip(chain.lw.tolist(), chain.rw.tolist(), chain.lp.tolist(),
+            chain.rp.tolist(), chain.stride.tolist(),
+            chain.is_downsample.tolist())
+
+
+def _compiled_chain(source, dest):
+    key = (source, dest)
+    chain = _compiled_cache.get(key)
+    if chain is None:
+        chain = _compiled_cache[key] = compile_chain(source, dest)
+    return chain
+
+
+def input_range_multi(source, dest, full, sub_b, sub_e, gs):
+    """
+    Compute the input ranges for a whole minibatch of output windows of the
+    chain source => dest.  The windows share the full output range full and
+    grid spacing gs, and sub_b, sub_e are arrays of their half-open bounds.
+    Returns (full_b, full_e), (sub_b, sub_e), gs as for input_range_batched.
+    """
+    return input_range_batched(_compiled_chain(source, dest), full[0],
+            full[1], sub_b, sub_e, gs)
+
+
+def _batch_bounds(layers, gs, forward, *bounds):
+    """
+    Broadcast the bounds to arrays of a common shape.  They are int64 unless
+    traversing layers (forward if output_range, else input_range) starting at
+    grid spacing gs could produce a coordinate outside the int64 range, in
+    which case they are object arrays of Python ints.
+    """
+    bounds = np.broadcast_arrays(*(np.asarray(b) for b in bounds))
+    reach = max((max(int(b.max()), -int(b.min())) for b in bounds if b.size),
+            default=0)
+    for lw, rw, lp, rp, st, ds in layers:
+        # Each layer moves a bound by less than this many units
+        reach += (lw + rw + st + 1) * gs * st
+        if ds == forward:
+            gs *= st
         else:
-            assert gs % vc.stride == 0
-            gs //= vc.stride
-        max_gs = max(gs, max_gs)
-        if vc is dest:
-            break
-        vc = vc.child
-    return max_gs
+            gs //= st
+    dtype = np.int64 if reach < 2 ** 62 else object
+    return [b.astype(dtype) for b in bounds]
+
 
+def input_range_batched(chain, full_b, full_e, sub_b, sub_e, gs):
+    """
+    Vectorized form of input_range over many output ranges at once.  The
+    ranges are given as arrays of half-open [b, e) bounds, all with grid
+    spacing gs.  Returns (full_b, full_e), (sub_b, sub_e), gs in the same
+    form.
+
+    Raises exception if any resulting input range is empty
+    """
+    layers = list(_layers(chain))[::-1]
+    fb, fe, sb, se = _batch_bounds(layers, gs, False, full_b, full_e, sub_b,
+            sub_e)
+    fe = fe - 1
+    se = se - 1
+
+    if use_numba and fb.dtype == np.int64 and _jit_module() is not None:
+        return _input_range_jit(chain, fb, fe, sb, se, gs)
+
+    for lw, rw, lp, rp, st, ds in layers:
+        if ds:
+            assert gs % st == 0
+            gs //= st
+            if np.any(fe < fb) or np.any(se < sb):
+                raise RuntimeError('empty input range')
+            fb = fb - (lw - lp) * gs
+            fe = fe + (rw - rp) * gs
+            sb = np.maximum(sb - lw * gs, fb)
+            se = np.minimum(se + rw * gs, fe)
+        else:
+            gs_out = gs
+            gs *= st
+            sub_in_adj_b = sb - lw * gs_out
+            sub_in_adj_e = se + rw * gs_out
+            fb = fb - (lw - lp) * gs_out
+            full_in_pre_e = fe + (rw - rp) * gs_out
+            fe = full_in_pre_e + (-(full_in_pre_e - fb) % gs)
+            assert np.all(sub_in_adj_b <= fe)
+            assert np.all(fb <= sub_in_adj_e)
+            sb = sub_in_adj_b + (fe - sub_in_adj_b) % gs
+            se = sub_in_adj_e - (sub_in_adj_e - fb) % gs
+            if np.any(se - sb <= 0):
+                raise RuntimeError('empty input range')
+
+    return (fb, fe + 1), (sb, se + 1), gs
+
+
+def _jit_module():
+    """
+    Return the vconv_jit module of compiled kernels, or None if numba is not
+    installed.  numba is only imported here, since it is slow to import.
+    """
+    global _jit
+    if _jit is None:
+        try:
+            import vconv_jit
+            _jit = vconv_jit
+        except ImportError:
+            _jit = False
+    return _jit or None
+
+
+def _input_range_jit(chain, fb, fe, sb, se, gs):
+    """
+    input_range_batched using the compiled kernel.  Bounds are inclusive.
+    Raises the same exception as the NumPy implementation would.
+    """
+    jit = _jit_module()
+    n_layers = len(chain.stride)
+    gs_out = np.zeros(n_layers, dtype=np.int64)
+    gs_in = np.zeros(n_layers, dtype=np.int64)
+    # Layers stop and above can be traversed.  If the grid spacing at some
+    # layer isn't a whole number, the NumPy path fails there, unless a query
+    # already failed at an earlier (higher) layer.
+    stop = 0
+    for i in reversed(range(n_layers)):
+        st = int(chain.stride[i])
+        gs_out[i] = gs
+        if chain.is_downsample[i]:
+            if gs % st != 0:
+                stop = i + 1
+                break
+            gs //= st
+        else:
+            gs *= st
+        gs_in[i] = gs
+
+    shape = fb.shape
+    fb, fe, sb, se = (a.flatten() for a in (fb, fe, sb, se))
+    fail_layer = np.full(fb.shape, -1, dtype=np.int64)
+    fail_kind = np.zeros(fb.shape, dtype=np.int64)
+    jit.input_range_kernel(chain.lw, chain.rw, chain.lp, chain.rp,
+            chain.is_downsample, gs_in, gs_out, stop, fb, fe, sb, se,
+            fail_layer, fail_kind)
+
+    top = fail_layer.max(initial=-1)
+    if top >= 0:
+        # the NumPy path raises at the first failing layer it reaches, where
+        # assertions precede the empty range check
+        assert not np.any(fail_kind[fail_layer == top] == jit.ASSERT)
+        raise RuntimeError('empty input range')
+    assert stop == 0
+    return ((fb.reshape(shape), fe.reshape(shape) + 1),
+            (sb.reshape(shape), se.reshape(shape) + 1), gs)
+
+
+def output_range_batched(chain, full_b, full_e, sub_b, sub_e, gs):
+    """
+    Vectorized form of output_range over many input ranges at once.  The
+    ranges are given as arrays of half-open [b, e) bounds, all with grid
+    spacing gs.  Returns (full_b, full_e), (sub_b, sub_e), gs in the same
+    form.
+
+    Raises exception if any resulting output range is empty
+    """
+    layers = list(_layers(chain))
+    fb, fe, sb, se = _batch_bounds(layers, gs, True, full_b, full_e, sub_b,
+            sub_e)
+    fe = fe - 1
+    se = se - 1
+    dt = fb.dtype
+
+    for lw, rw, lp, rp, st, ds in layers:
+        if ds:
+            gs_in = gs
+            gs *= st
+            fb = fb + (lw - lp) * gs_in
+            full_out_pre_e = fe - (rw - rp) * gs_in
+            sub_out_pre_b = sb + lw * gs_in
+            sub_out_pre_e = se - rw * gs_in
+            if (np.any(full_out_pre_e < fb) or
+                    np.any(sub_out_pre_e < sub_out_pre_b)):
+                raise RuntimeError('empty output range')
+            fe = full_out_pre_e - (full_out_pre_e - fb) % gs
+            sb = sub_out_pre_b + (fe - sub_out_pre_b) % gs
+            se = sub_out_pre_e - (sub_out_pre_e - fb) % gs
+            if np.any(se - sb <= 0):
+                raise RuntimeError('empty output range')
+        else:
+            assert gs % st == 0
+            gs //= st
+            full_out_b = fb + (lw - lp) * gs
+            full_out_e = fe - (rw - rp) * gs
+            # explicit dtype, since bounds may be Python ints beyond int64
+            sb = np.where(sb == fb, np.asarray(full_out_b, dtype=dt),
+                    np.asarray(sb + (lw - st + 1) * gs, dtype=dt))
+            se = np.where(se == fe, np.asarray(full_out_e, dtype=dt),
+                    np.asarray(se + (st - 1 - rw) * gs, dtype=dt))
+            fb, fe = full_out_b, full_out_e
+            if np.any(fe < fb) or np.any(se < sb):
+                raise RuntimeError('empty output range')
+
+    return (fb, fe + 1), (sb, se + 1), gs
@@ -0,0 +1,55 @@
+import numba
+
+"""
+Compiled kernels for vconv.  Imported by vconv on first use, since numba is
+an optional dependency and slow to import.
+"""
+
+# fail_kind values
+EMPTY = 1
+ASSERT = 2
+
+
+@numba.njit(cache=True, parallel=True)
+def input_range_kernel(lw, rw, lp, rp, is_downsample, gs_in, gs_out, stop,
+        fb, fe, sb, se, fail_layer, fail_kind):
+    """
+    Same arithmetic as VirtualConv._input_range, applied from the last layer
+    down to layer stop, for each query independently.  Updates the inclusive
+    bounds fb, fe, sb, se in place.  For each query that fails, sets
+    fail_layer to the layer index and fail_kind to EMPTY (empty input range)
+    or ASSERT (sub range not overlapping the full range).
+    """
+    n = fb.shape[0]
+    for q in numba.prange(n):
+        f_b, f_e, s_b, s_e = fb[q], fe[q], sb[q], se[q]
+        for i in range(lw.shape[0] - 1, stop - 1, -1):
+            if is_downsample[i]:
+                g = gs_in[i]
+                if f_e < f_b or s_e < s_b:
+                    fail_layer[q] = i
+                    fail_kind[q] = EMPTY
+                    break
+                f_b = f_b - (lw[i] - lp[i]) * g
+                f_e = f_e + (rw[i] - rp[i]) * g
+                s_b = max(s_b - lw[i] * g, f_b)
+                s_e = min(s_e + rw[i] * g, f_e)
+            else:
+                g = gs_out[i]
+                g_in = gs_in[i]
+                s_adj_b = s_b - lw[i] * g
+                s_adj_e = s_e + rw[i] * g
+                f_b = f_b - (lw[i] - lp[i]) * g
+                f_pre_e = f_e + (rw[i] - rp[i]) * g
+                f_e = f_pre_e + (-(f_pre_e - f_b)) % g_in
+                if s_adj_b > f_e or f_b > s_adj_e:
+                    fail_layer[q] = i
+                    fail_kind[q] = ASSERT
+                    break
+                s_b = s_adj_b + (f_e - s_adj_b) % g_in
+                s_e = s_adj_e - (s_adj_e - f_b) % g_in
+                if s_e - s_b <= 0:
+                    fail_layer[q] = i
+                    fail_kind[q] = EMPTY
+                    break
+        fb[q], fe[q], sb[q], se[q] = f_b, f_e, s_b, s_e
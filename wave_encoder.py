@@ -77,8 +77,7 @@ class Encoder(nn.Module):
         self.vc['end'] = self.net[-1].vc
 
     def set_parent_vc(self, parent_vc):
-        self.vc['beg'].parent = parent_vc
-        parent_vc.child = self.vc['beg']
+        vconv.set_parent(self.vc['beg'], parent_vc)
 
     def update_metrics(self):
         self.metrics = {}